@@ -1,14 +1,24 @@
 import threading
 import time
+import atexit
+import hmac
 import datetime
 import monitor
 import os
 from dotenv import load_dotenv
 import logging
 import schwab
-import json
+import orjson
+import numpy as np
 from flask import Flask, render_template, jsonify, request, Response
-from functools import wraps
+from functools import wraps, lru_cache
+from contextlib import contextmanager
+from collections import deque
+
+try:
+    from fastrlock.rlock import FastRLock as _CountLock # C-level lock, much cheaper when uncontended
+except ImportError:
+    _CountLock = threading.Lock
 
 # --- Existing Setup ---
 logging.basicConfig(
@@ -25,8 +35,11 @@ FLASK_PASSWORD = os.getenv('FLASK_PASSWORD')
 
 # --- Basic Auth Helper Functions ---
 def check_auth(username, password):
-    """Check if a username/password combination is valid."""
-    return username == FLASK_USERNAME and password == FLASK_PASSWORD
+    """Check if a username/password combination is valid (constant-time)."""
+    # Compare as bytes (compare_digest rejects non-ASCII str) and use & so both always run
+    username_ok = hmac.compare_digest((username or "").encode(), (FLASK_USERNAME or "").encode())
+    password_ok = hmac.compare_digest((password or "").encode(), (FLASK_PASSWORD or "").encode())
+    return username_ok & password_ok
 
 def authenticate():
     """Sends a 401 response that enables basic auth."""
@@ -49,126 +62,277 @@ def requires_auth(f):
     return decorated
 
 # --- State and Lock ---
+class RWLock:
+    """Readers-writer lock: any number of readers, or a single writer."""
+
+    def __init__(self):
+        self._readers = 0
+        self._readers_lock = _CountLock()     # Guards the reader count
+        self._writer_lock = threading.Lock()  # Held while readers or a writer are active
+
+    @contextmanager
+    def gen_rlock(self):
+        with self._readers_lock:
+            self._readers += 1
+            if self._readers == 1:
+                self._writer_lock.acquire() # First reader locks out writers
+        try:
+            yield
+        finally:
+            with self._readers_lock:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._writer_lock.release() # Last reader lets writers in
+
+    @contextmanager
+    def gen_wlock(self):
+        with self._writer_lock:
+            yield
+
 current_state = {
     "active_orders": [],
     "monitoring_active": False,
     "last_updated": None,
     "orders_recreated": 0,
     "positions": {"long": 0, "short": 0},
-    "net_liq_history": [],
+    "net_liq_history": deque(maxlen=100), # Oldest points drop off automatically
     "ignored_orders": set()
 }
-state_lock = threading.Lock()
+# {order_id_str: order} view of current_state["active_orders"], rebuilt whenever the list
+# is replaced. Kept outside current_state so it never ends up in the JSON payload.
+orders_by_id = {}
+state_lock = RWLock()
+# Encoded /api/orders payload; every writer of current_state resets it to None
+orders_json_cache = {"payload": None}
+
+# --- Monitor Pacing ---
+# Cycle every CHECK_INTERVAL seconds; MONITOR_IDLE_INTERVAL applies once no dashboard has
+# polled /api/orders for DASHBOARD_IDLE_SECONDS. It defaults to CHECK_INTERVAL because
+# order recreation shouldn't slow down just because nobody is watching.
+MONITOR_IDLE_INTERVAL = float(os.getenv('MONITOR_IDLE_INTERVAL', str(monitor.CHECK_INTERVAL)))
+DASHBOARD_IDLE_SECONDS = 30
+monitor_wake = threading.Event() # Set by the toggle/stop endpoints to force an immediate re-sync
+last_orders_request = {"time": 0.0} # time.monotonic() of the latest /api/orders hit
+
+# Parsed token.json for /api/token-status as ((path, mtime_ns, size), data)
+token_cache = {"entry": None}
+
+# --- Ignore List Persistence ---
+# ignored_items.json is the canonical snapshot; ignored_items.log holds "+id"/"-id" lines for
+# changes made since. The log is folded back into the snapshot at startup, at clean shutdown
+# and whenever it reaches IGNORED_LOG_COMPACT_LINES.
+IGNORED_ITEMS_LOG_PATH = 'ignored_items.log'
+IGNORED_LOG_COMPACT_LINES = 1000
+SAVE_DEBOUNCE_SECONDS = 0.5 # Quiet period after the last change before writing
+save_requested = threading.Event()
+save_lock = threading.Lock() # Serializes the saver thread with startup/shutdown compaction
+pending_ignore_ops = deque() # Changes not yet appended to the log, e.g. "+123"
+ignored_log_lines = 0
 ignored_symbols = set() 
+NO_IGNORED_SYMBOLS = frozenset() # Passed to is_order_monitored while symbol ignoring is disabled
 
 # --- Utility Functions ---
 
-def prepare_for_json(obj):
-    """Prepare an object for JSON serialization by converting non-serializable types."""
-    if isinstance(obj, set):
+def json_default(obj):
+    """orjson fallback for types it can't serialize natively (datetimes are handled by orjson)."""
+    if isinstance(obj, (set, frozenset, deque)):
         return list(obj)
-    elif isinstance(obj, (datetime.datetime, datetime.date)):
-         return obj.isoformat() 
-    elif isinstance(obj, dict):
-        return {k: prepare_for_json(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [prepare_for_json(i) for i in obj]
-    return obj
-
-def get_order_symbol(order):
-    """Extract symbol from order data safely"""
-    try:
-        # Check primary instrument first
-        instrument = order.get('instrument')
-        if instrument and isinstance(instrument, dict):
-             symbol = instrument.get('symbol')
-             if symbol: return symbol
-
-        # Fallback to orderLegCollection
-        legs = order.get('orderLegCollection', [])
-        if legs and isinstance(legs, list) and len(legs) > 0:
-            leg_instrument = legs[0].get('instrument')
-            if leg_instrument and isinstance(leg_instrument, dict):
-                return leg_instrument.get('symbol')
-    except Exception as e:
-        logger.warning(f"Could not extract symbol from order: {order.get('orderId', 'N/A')}. Error: {e}", exc_info=True)
-    return None
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
 
 def is_order_monitored(order_id, symbol, ignored_orders_set, ignored_symbols_set):
     """Check if an order should be monitored based on ID and symbol ignore lists."""
     if order_id is None:
         return True # Cannot ignore without an ID
 
-    order_id_str = str(order_id)
-
-    if order_id_str in ignored_orders_set:
-        # logger.debug(f"Order ID {order_id_str} is explicitly ignored.")
+    # order_id is already a string (IDs are normalized when orders are fetched)
+    if order_id in ignored_orders_set:
+        # logger.debug(f"Order ID {order_id} is explicitly ignored.")
         return False
     # if symbol and symbol in ignored_symbols_set: # Uncomment if symbol ignoring is needed here
-    #     logger.debug(f"Symbol {symbol} (Order ID {order_id_str}) is ignored.")
+    #     logger.debug(f"Symbol {symbol} (Order ID {order_id}) is ignored.")
     #     return False
 
-    # logger.debug(f"Order ID {order_id_str} (Symbol: {symbol}) is monitored.")
+    # logger.debug(f"Order ID {order_id} (Symbol: {symbol}) is monitored.")
     return True
 
 def update_monitoring_status_in_orders(orders_list, ignored_orders_set):
     """Update isMonitored flag in all orders based on current ignore lists.
-       Assumes this is called when the state_lock might be held or immediately after.
+       Called by every writer of ignored_orders/active_orders while holding the write lock,
+       so readers never need to recompute the flags.
     """
     if not isinstance(orders_list, list):
         logger.warning("update_monitoring_status_in_orders received non-list for orders.")
         return
 
+    # Same rule as is_order_monitored, inlined: symbols aren't consulted and an
+    # order without an ID can't be ignored
     for order in orders_list:
-         if not isinstance(order, dict): continue # Skip non-dict items
-         order_id = order.get("orderId")
-         symbol = get_order_symbol(order)
-         # Update the flag based on the provided ignored_orders_set
-         order["isMonitored"] = is_order_monitored(
-             order_id, symbol, ignored_orders_set, ignored_symbols # Pass current sets
-         )
-
-def save_ignored_items():
-    """Save ignored orders and symbols to disk, minimizing lock time."""
-    ignored_orders_list = []
-    ignored_symbols_list = []
+        order_id = order.get("orderId")
+        if order_id is None:
+            order["isMonitored"] = True
+            continue
+        order["isMonitored"] = order_id not in ignored_orders_set
+
+def set_order_monitored_flag(order_id_str, monitored):
+    """Update isMonitored on the one active order with this ID. Caller holds the write lock."""
+    order = orders_by_id.get(order_id_str)
+    if order is not None:
+        order["isMonitored"] = monitored
+
+def save_ignored_items(ignored_orders_list=None, ignored_symbols_list=None):
+    """Save ignored orders and symbols to disk, minimizing lock time. Returns True on success.
+       Pass the lists to save a copy the caller already took; otherwise the current state is copied.
+    """
     try:
-        # --- Acquire lock only to read data ---
-        with state_lock:
-            # logger.debug("Acquired lock for save_ignored_items read")
-            # Safely copy the sets to lists for saving
-            ignored_orders_list = list(current_state.get('ignored_orders', set()))
-            ignored_symbols_list = list(ignored_symbols) 
-            # logger.debug("Releasing lock for save_ignored_items read")
-        # --- Lock released ---
+        if ignored_orders_list is None:
+            # --- Acquire lock only to read data ---
+            with state_lock.gen_rlock():
+                # logger.debug("Acquired lock for save_ignored_items read")
+                # Safely copy the sets to lists for saving
+                ignored_orders_list = list(current_state.get('ignored_orders', set()))
+                ignored_symbols_list = list(ignored_symbols) 
+                # logger.debug("Releasing lock for save_ignored_items read")
+            # --- Lock released ---
 
         # --- Perform file I/O outside the lock ---
-        logger.debug(f"Performing file I/O for save_ignored_items. Orders: {len(ignored_orders_list)}, Symbols: {len(ignored_symbols_list)}")
-        with open('ignored_items.json', 'w') as f:
-            json.dump({
-                'orders': ignored_orders_list,
-                'symbols': ignored_symbols_list
-            }, f, indent=2) 
+        logger.debug("Performing file I/O for save_ignored_items. Orders: %d, Symbols: %d", len(ignored_orders_list), len(ignored_symbols_list))
+        payload = orjson.dumps({
+            'orders': ignored_orders_list,
+            'symbols': ignored_symbols_list
+        }, option=orjson.OPT_INDENT_2)
+        # Write to a temp file and swap it in so a crash never leaves a truncated file
+        with open('ignored_items.json.tmp', 'wb') as f:
+            f.write(payload)
+        os.replace('ignored_items.json.tmp', 'ignored_items.json')
         logger.info(f"Saved ignored items to disk (Orders: {len(ignored_orders_list)}, Symbols: {len(ignored_symbols_list)})")
         # logger.debug("Finished file I/O for save_ignored_items")
+        return True
 
     except Exception as e:
         logger.error(f"Failed to save ignored items: {e}", exc_info=True) # Add traceback
+        return False
+
+def queue_ignored_order_change(order_id_str, ignored):
+    """Queue an ignore-list change for the log; a burst of changes results in one write."""
+    pending_ignore_ops.append(('+' if ignored else '-') + order_id_str)
+    save_requested.set()
+
+def replay_ignored_items_log(ignored_orders_set):
+    """Apply the change log on top of a loaded snapshot.
+       Returns (lines applied, bytes of complete lines); anything past that offset is a torn tail.
+    """
+    if not os.path.exists(IGNORED_ITEMS_LOG_PATH):
+        return 0, 0
+    applied = 0
+    clean_end = 0
+    with open(IGNORED_ITEMS_LOG_PATH, 'rb') as f:
+        for raw_line in f:
+            if not raw_line.endswith(b'\n'):
+                break # Torn final line from a crash mid-append
+            clean_end += len(raw_line)
+            line = raw_line.decode().strip()
+            if line[:1] == '+':
+                ignored_orders_set.add(line[1:])
+            elif line[:1] == '-':
+                ignored_orders_set.discard(line[1:])
+            else:
+                continue
+            applied += 1
+    return applied, clean_end
+
+def append_ignore_ops(ops):
+    """Append ops to the change log and fsync it. Caller holds save_lock.
+       On failure the log is cut back to where it was and the error is re-raised.
+    """
+    global ignored_log_lines
+    with open(IGNORED_ITEMS_LOG_PATH, 'ab') as f:
+        start = f.tell()
+        try:
+            f.write(''.join(op + '\n' for op in ops).encode())
+            f.flush()
+            os.fsync(f.fileno())
+        except OSError:
+            # Drop a partial append (e.g. disk full) so the next one can't run into it
+            f.truncate(start)
+            raise
+    ignored_log_lines += len(ops)
+    logger.debug("Appended %d ignore-list changes to %s", len(ops), IGNORED_ITEMS_LOG_PATH)
+
+def take_pending_ignore_ops():
+    """Remove and return every queued ignore-list change, oldest first."""
+    ops = []
+    while pending_ignore_ops:
+        ops.append(pending_ignore_ops.popleft())
+    return ops
+
+def compact_ignored_items():
+    """Fold the change log into a fresh snapshot. Caller holds save_lock. Returns True on success."""
+    global ignored_log_lines
+    # Log every queued change before copying the state, with writers held off (they queue
+    # under the write lock). The log then ends in exactly the snapshot's state, so replaying
+    # it after a crash between the snapshot and the truncate changes nothing.
+    with state_lock.gen_rlock():
+        ops = take_pending_ignore_ops()
+        if ops:
+            try:
+                append_ignore_ops(ops)
+            except Exception as e:
+                logger.error(f"Failed to append to {IGNORED_ITEMS_LOG_PATH}: {e}. Keeping the changes queued.", exc_info=True)
+                pending_ignore_ops.extendleft(reversed(ops))
+                return False
+        ignored_orders_list = list(current_state.get('ignored_orders', set()))
+        ignored_symbols_list = list(ignored_symbols)
+    if not save_ignored_items(ignored_orders_list, ignored_symbols_list):
+        return False
+    # Truncate only once the snapshot is safely in place
+    open(IGNORED_ITEMS_LOG_PATH, 'wb').close()
+    ignored_log_lines = 0
+    return True
+
+def flush_ignored_items():
+    """Append queued ignore-list changes to the log, compacting it once it grows large."""
+    with save_lock:
+        ops = take_pending_ignore_ops()
+        if not ops:
+            return
+        try:
+            append_ignore_ops(ops)
+        except Exception as e:
+            logger.error(f"Failed to append to {IGNORED_ITEMS_LOG_PATH}: {e}. Writing a full snapshot instead.", exc_info=True)
+            # Requeue so the compaction logs them first; newer changes queued meanwhile stay after them
+            pending_ignore_ops.extendleft(reversed(ops))
+            compact_ignored_items()
+            return
+        if ignored_log_lines >= IGNORED_LOG_COMPACT_LINES:
+            compact_ignored_items()
+
+def close_ignored_items():
+    """Flush queued changes and compact the log (run at exit)."""
+    flush_ignored_items()
+    with save_lock:
+        if ignored_log_lines:
+            compact_ignored_items()
+
+def ignored_items_saver():
+    """Background thread that logs ignore-list changes once they settle."""
+    while True:
+        save_requested.wait()
+        save_requested.clear()
+        # Keep extending the wait while further changes arrive
+        while save_requested.wait(SAVE_DEBOUNCE_SECONDS):
+            save_requested.clear()
+        flush_ignored_items()
 
 def load_ignored_items():
     """Load previously saved ignored orders and symbols from disk."""
-    global ignored_symbols
+    global ignored_symbols, ignored_log_lines
     try:
         if not os.path.exists('ignored_items.json'):
             logger.info("No ignored items file found. Starting with empty ignore lists.")
-            # Ensure sets exist even if file doesn't
-            with state_lock:
-                current_state["ignored_orders"] = set()
-            ignored_symbols = set()
-            return
-
-        with open('ignored_items.json', 'r') as f:
-            data = json.load(f)
+            data = {} # Changes may still be waiting in the log
+        else:
+            with open('ignored_items.json', 'rb') as f:
+                data = orjson.loads(f.read())
 
         loaded_ignored_orders = set()
         loaded_ignored_symbols = set()
@@ -179,24 +343,40 @@ def load_ignored_items():
         if 'symbols' in data and isinstance(data['symbols'], list):
             loaded_ignored_symbols = set(str(symbol) for symbol in data['symbols'])
 
+        # Apply changes logged since the last snapshot
+        ignored_log_lines, clean_end = replay_ignored_items_log(loaded_ignored_orders)
+        if os.path.exists(IGNORED_ITEMS_LOG_PATH) and os.path.getsize(IGNORED_ITEMS_LOG_PATH) > clean_end:
+            # Cut off a torn last line, otherwise the next append would be glued onto it
+            logger.warning(f"Discarding a partially written line at the end of {IGNORED_ITEMS_LOG_PATH}")
+            os.truncate(IGNORED_ITEMS_LOG_PATH, clean_end)
+
         # Update global/shared state under lock
-        with state_lock:
+        with state_lock.gen_wlock():
+            orders_json_cache["payload"] = None
             # logger.debug("Acquired lock for load_ignored_items write")
             current_state["ignored_orders"] = loaded_ignored_orders
             ignored_symbols = loaded_ignored_symbols # Update global
+            update_monitoring_status_in_orders(current_state["active_orders"], loaded_ignored_orders)
             # logger.debug("Released lock for load_ignored_items write")
 
-        logger.info(f"Loaded {len(loaded_ignored_orders)} ignored orders and {len(loaded_ignored_symbols)} ignored symbols")
+        logger.info(f"Loaded {len(loaded_ignored_orders)} ignored orders and {len(loaded_ignored_symbols)} ignored symbols ({ignored_log_lines} logged changes)")
+
+        if ignored_log_lines:
+            with save_lock:
+                compact_ignored_items() # Start with an empty log
 
     except FileNotFoundError:
          logger.info("ignored_items.json not found, starting fresh.")
-         with state_lock:
+         with state_lock.gen_wlock():
+             orders_json_cache["payload"] = None
              current_state["ignored_orders"] = set()
+             update_monitoring_status_in_orders(current_state["active_orders"], current_state["ignored_orders"])
          ignored_symbols = set()
     except Exception as e:
         logger.error(f"Failed to load ignored items: {e}", exc_info=True)
         # Ensure sets exist even on error
-        with state_lock:
+        with state_lock.gen_wlock():
+            orders_json_cache["payload"] = None
             if "ignored_orders" not in current_state:
                 current_state["ignored_orders"] = set()
         if 'ignored_symbols' not in globals(): # Or check if it's None
@@ -213,28 +393,23 @@ def index():
 @app.route('/api/orders')
 @requires_auth  
 def get_orders():
-    with state_lock:
+    last_orders_request["time"] = time.monotonic()
+    with state_lock.gen_rlock():
         # logger.debug("Acquired lock for get_orders")
-        # Create a deep copy to avoid modifying state while serializing
-        state_copy = current_state.copy()
-        # Ensure ignored_orders is included if it exists
-        if "ignored_orders" in state_copy:
-             state_copy["ignored_orders"] = list(state_copy["ignored_orders"]) # Convert set for JSON
-
-        # Update isMonitored flag before sending
-        update_monitoring_status_in_orders(
-            state_copy.get("active_orders", []),
-            current_state.get("ignored_orders", set()) # Use the live set for checking
-        )
+        # Reuse the last encoding unless a writer has touched the state since
+        payload = orders_json_cache["payload"]
+        if payload is None:
+            # Serialize the live state directly; the read lock keeps writers out and
+            # the writers keep the isMonitored flags current
+            try:
+                payload = orjson.dumps(current_state, default=json_default, option=orjson.OPT_NON_STR_KEYS)
+            except Exception as e:
+                logger.error(f"Error serializing state for /api/orders: {e}", exc_info=True)
+                return jsonify({"error": "Failed to serialize state"}), 500
+            orders_json_cache["payload"] = payload
         # logger.debug("Releasing lock for get_orders")
 
-    # Serialize outside the lock
-    try:
-        serializable_state = prepare_for_json(state_copy)
-        return jsonify(serializable_state)
-    except Exception as e:
-        logger.error(f"Error serializing state for /api/orders: {e}", exc_info=True)
-        return jsonify({"error": "Failed to serialize state"}), 500
+    return Response(payload, mimetype='application/json')
 
 
 @app.route('/api/orders/<order_id>/stop_monitoring', methods=['POST'])
@@ -246,34 +421,33 @@ def stop_order_monitoring(order_id):
     needs_save = False
     try:
         # --- Update in-memory state quickly ---
-        with state_lock:
-            logger.debug(f"Acquired lock for stop_monitoring {order_id_str}")
+        with state_lock.gen_wlock():
+            orders_json_cache["payload"] = None
+            logger.debug("Acquired lock for stop_monitoring %s", order_id_str)
             # Ensure the set exists
             if "ignored_orders" not in current_state:
                 current_state["ignored_orders"] = set()
 
             if order_id_str not in current_state["ignored_orders"]:
                 current_state["ignored_orders"].add(order_id_str)
+                # Queue under the lock so the log records changes in the same order as memory
+                queue_ignored_order_change(order_id_str, True)
                 needs_save = True
                 logger.info(f"Added order {order_id_str} to ignore list (in memory).")
 
-                # Update monitoring status in the current active orders list immediately
-                update_monitoring_status_in_orders(
-                    current_state.get("active_orders", []),
-                    current_state["ignored_orders"] # Pass the updated set
-                )
+                # Only this order's flag can have changed
+                set_order_monitored_flag(order_id_str, False)
             else:
                 logger.info(f"Order {order_id_str} was already in the ignore list.")
-            logger.debug(f"Released lock for stop_monitoring {order_id_str}")
+            logger.debug("Released lock for stop_monitoring %s", order_id_str)
         # --- Lock released ---
 
-        # --- Perform file I/O outside the lock IF needed ---
+        # --- The saver thread writes the queued change once changes settle ---
         if needs_save:
-            logger.debug(f"Initiating save ignored items after stopping {order_id_str}")
-            save_ignored_items() # This function now handles its own locking minimally
-            logger.debug(f"Completed save ignored items after stopping {order_id_str}")
+            logger.debug("Scheduled save of ignored items after stopping %s", order_id_str)
+            monitor_wake.set() # Re-sync tracking with the new ignore list right away
         else:
-             logger.debug(f"No save needed for {order_id_str}")
+             logger.debug("No save needed for %s", order_id_str)
 
         return jsonify({
             "success": True,
@@ -302,8 +476,9 @@ def toggle_order_monitoring(order_id):
         should_monitor = data.get('monitor', False) # True to monitor, False to ignore
 
         # --- Update in-memory state quickly ---
-        with state_lock:
-            logger.debug(f"Acquired lock for toggle_monitoring {order_id_str}")
+        with state_lock.gen_wlock():
+            orders_json_cache["payload"] = None
+            logger.debug("Acquired lock for toggle_monitoring %s", order_id_str)
             if "ignored_orders" not in current_state:
                 current_state["ignored_orders"] = set()
 
@@ -313,35 +488,33 @@ def toggle_order_monitoring(order_id):
             if should_monitor and currently_ignored:
                 # Resume monitoring: remove from ignored list
                 current_state["ignored_orders"].discard(order_id_str)
+                queue_ignored_order_change(order_id_str, False)
                 needs_save = True
                 logger.info(f"Resumed monitoring for order {order_id_str} (in memory).")
             elif not should_monitor and not currently_ignored:
                 # Stop monitoring: add to ignored list
                 current_state["ignored_orders"].add(order_id_str)
+                queue_ignored_order_change(order_id_str, True)
                 needs_save = True
                 logger.info(f"Stopped monitoring for order {order_id_str} (in memory).")
             else:
                 logger.info(f"Order {order_id_str} monitoring state already as requested ({should_monitor}). No change.")
 
-            # Update monitoring status in the current active orders list if state changed
-            if needs_save:
-                 update_monitoring_status_in_orders(
-                     current_state.get("active_orders", []),
-                     current_state["ignored_orders"] # Pass the updated set
-                 )
-
             # Read the final status after potential change
             current_monitoring_status = order_id_str not in current_state["ignored_orders"]
-            logger.debug(f"Released lock for toggle_monitoring {order_id_str}")
+
+            # Only this order's flag can have changed
+            if needs_save:
+                set_order_monitored_flag(order_id_str, current_monitoring_status)
+            logger.debug("Released lock for toggle_monitoring %s", order_id_str)
         # --- Lock released ---
 
-        # --- Perform file I/O outside the lock IF needed ---
+        # --- The saver thread writes the queued change once changes settle ---
         if needs_save:
-            logger.debug(f"Initiating save ignored items after toggling {order_id_str}")
-            save_ignored_items()
-            logger.debug(f"Completed save ignored items after toggling {order_id_str}")
+            logger.debug("Scheduled save of ignored items after toggling %s", order_id_str)
+            monitor_wake.set()
         else:
-             logger.debug(f"No save needed for {order_id_str}")
+             logger.debug("No save needed for %s", order_id_str)
 
         return jsonify({
             "success": True,
@@ -361,7 +534,11 @@ def get_token_status():
     try:
         # Read the token file directly to avoid authenticating again
         token_path = os.getenv('SCHWAB_TOKEN_PATH', 'token.json')
-        if not os.path.exists(token_path):
+        try:
+            token_stat = os.stat(token_path)
+        except FileNotFoundError:
+            token_stat = None
+        if token_stat is None:
             # Return a structured response when token file not found
             return jsonify({
                 "error": "Token file not found",
@@ -372,8 +549,15 @@ def get_token_status():
                 "refresh_token_age": 0
             }), 404
 
-        with open(token_path, 'r') as f:
-            token_data = json.load(f)
+        # Only re-read the file when it has changed (i.e. after a token refresh)
+        cache_key = (token_path, token_stat.st_mtime_ns, token_stat.st_size)
+        cached = token_cache["entry"]
+        if cached is not None and cached[0] == cache_key:
+            token_data = cached[1]
+        else:
+            with open(token_path, 'rb') as f:
+                token_data = orjson.loads(f.read())
+            token_cache["entry"] = (cache_key, token_data)
 
         # Calculate expiration time for access token
         current_time = time.time()
@@ -411,11 +595,11 @@ def get_token_status():
 
 def background_monitor():
     """Background thread to monitor orders and update dashboard state"""
-    global current_state # Ensure we're modifying the global state
+    global current_state, orders_by_id # Ensure we're modifying the global state
 
     try:
         logger.info("Initializing Schwab client for background monitor...")
-        client = get_schwab_client()
+        client = get_shared_schwab_client()
         account_hash = get_account_hash(client)
         logger.info(f"Starting background monitoring for account {account_hash[:8]}...")
 
@@ -423,7 +607,8 @@ def background_monitor():
         tracked_orders = {} # {order_id_str: order_data} - Use strings for consistency
 
         # Initialize monitoring state
-        with state_lock:
+        with state_lock.gen_wlock():
+            orders_json_cache["payload"] = None
             # logger.debug("Acquired lock for background_monitor init")
             current_state["monitoring_active"] = True
             if "ignored_orders" not in current_state:
@@ -433,7 +618,6 @@ def background_monitor():
         while True:
             # logger.debug("Background monitor loop start.")
             local_ignored_orders = set()
-            local_ignored_symbols = set() # If used
 
             try:
                 # --- Fetch data (API calls outside lock) ---
@@ -446,50 +630,45 @@ def background_monitor():
                      time.sleep(10) # Wait before retrying
                      continue
 
-                latest_order_ids = {str(order.get('orderId')) for order in active_orders_list if order.get('orderId')}
-                # logger.debug(f"Latest active order IDs: {latest_order_ids}")
-
                 # --- Get current ignore lists (brief lock) ---
-                with state_lock:
+                with state_lock.gen_rlock():
                     # logger.debug("Acquired lock for reading ignore lists")
                     local_ignored_orders = current_state.get("ignored_orders", set()).copy()
-                    local_ignored_symbols = ignored_symbols.copy() 
                     # logger.debug("Released lock for reading ignore lists")
 
                 # --- Process orders (logic outside lock, using local copies of ignore lists) ---
-                current_tracked_ids = set(tracked_orders.keys())
-                disappeared_order_ids = current_tracked_ids - latest_order_ids
-                orders_to_recreate = []
-
-                # Process disappeared orders
-                for order_id_str in disappeared_order_ids:
-                    order_data = tracked_orders.pop(order_id_str, None) # Remove from tracking
-                    if order_data:
-                        symbol = get_order_symbol(order_data)
-                        # Check if it *should* be monitored before deciding to recreate
-                        if is_order_monitored(order_id_str, symbol, local_ignored_orders, local_ignored_symbols):
-                            logger.warning(f"Monitored order {order_id_str} ({symbol}) disappeared. Queuing for recreation.")
-                            orders_to_recreate.append(order_data)
-                        else:
-                            logger.info(f"Ignored order {order_id_str} ({symbol}) disappeared. No action needed.")
-                    else:
-                         logger.warning(f"Order ID {order_id_str} disappeared but wasn't in tracked_orders.")
-
-
-                # Update tracked orders with latest data / add new orders
+                # Single pass over the fetched orders: normalize IDs to strings (so every later
+                # lookup is a plain hash hit), collect the active IDs and refresh tracking.
+                # Orders ignored *while* active are dropped from tracking here.
+                latest_order_ids = set()
                 for order in active_orders_list:
-                     order_id = order.get('orderId')
-                     if order_id:
-                         order_id_str = str(order_id)
-                         tracked_orders[order_id_str] = order # Update or add
+                    order_id = order.get('orderId')
+                    order_id_str = str(order_id) if order_id is not None else None
+                    order['orderId'] = order_id_str
+                    if not order_id_str:
+                        continue
+                    latest_order_ids.add(order_id_str)
+                    if order_id_str in local_ignored_orders:
+                        if tracked_orders.pop(order_id_str, None) is not None:
+                            logger.info(f"Order {order_id_str} ({monitor.order_symbol(order)}) is now ignored. Removing from active tracking for recreation.")
+                    else:
+                        tracked_orders[order_id_str] = order # Update or add
+                # logger.debug(f"Latest active order IDs: {latest_order_ids}")
 
-                # Remove any orders from tracking that are now ignored but still active
-                # (This handles cases where an order is ignored *while* it's active)
-                for order_id_str in list(tracked_orders.keys()):
-                     symbol = get_order_symbol(tracked_orders[order_id_str])
-                     if not is_order_monitored(order_id_str, symbol, local_ignored_orders, local_ignored_symbols):
-                         logger.info(f"Order {order_id_str} ({symbol}) is now ignored. Removing from active tracking for recreation.")
-                         tracked_orders.pop(order_id_str, None)
+                # Anything still tracked but no longer active has disappeared
+                orders_to_recreate = []
+                for order_id_str in list(tracked_orders):
+                    if order_id_str in latest_order_ids:
+                        continue
+                    order_data = tracked_orders.pop(order_id_str) # Remove from tracking
+                    symbol = monitor.order_symbol(order_data)
+                    # Check if it *should* be monitored before deciding to recreate
+                    # Symbol ignoring is disabled in is_order_monitored; copy ignored_symbols here if it's re-enabled
+                    if is_order_monitored(order_id_str, symbol, local_ignored_orders, NO_IGNORED_SYMBOLS):
+                        logger.warning(f"Monitored order {order_id_str} ({symbol}) disappeared. Queuing for recreation.")
+                        orders_to_recreate.append(order_data)
+                    else:
+                        logger.info(f"Ignored order {order_id_str} ({symbol}) disappeared. No action needed.")
 
 
                 # --- Update shared state (acquire lock) ---
@@ -497,44 +676,58 @@ def background_monitor():
                 timestamp = datetime.datetime.now().isoformat()
                 positions = analyze_combined_data(active_orders_list, positions_data)
 
-                with state_lock:
+                # Update the isMonitored flag based on the latest ignore list; the fresh list
+                # isn't shared yet, so this needs no lock
+                update_monitoring_status_in_orders(
+                    active_orders_list,
+                    local_ignored_orders # Use the set we checked against
+                )
+
+                # In steady state only the timestamp and net liq move, so work out what
+                # actually changed before taking the write lock
+                with state_lock.gen_rlock():
+                    orders_changed = active_orders_list != current_state["active_orders"]
+                    positions_changed = positions != current_state["positions"]
+
+                with state_lock.gen_wlock():
+                    orders_json_cache["payload"] = None
                     # logger.debug("Acquired lock for state update")
-                    # Update the list of orders shown in the UI
-                    current_state["active_orders"] = active_orders_list
-                    # Update the isMonitored flag based on the latest ignore list
-                    update_monitoring_status_in_orders(
-                        current_state["active_orders"],
-                        local_ignored_orders # Use the set we checked against
-                    )
+                    if orders_changed:
+                        # Update the list of orders shown in the UI
+                        current_state["active_orders"] = active_orders_list
+                        orders_by_id = {order['orderId']: order for order in active_orders_list if order['orderId']}
+                    if positions_changed:
+                        current_state["positions"] = positions
 
                     current_state["last_updated"] = timestamp
-                    current_state["positions"] = positions
-                    current_state["orders_recreated"] = orders_recreated_count # Update count
+                    # orders_recreated is written when a recreation succeeds, below
 
                     # Update net liquidation history
-                    current_state["net_liq_history"].append((timestamp, net_liq))
-                    if len(current_state["net_liq_history"]) > 100: # Limit history size
-                        current_state["net_liq_history"] = current_state["net_liq_history"][-100:]
+                    current_state["net_liq_history"].append((timestamp, net_liq)) # deque caps the size
                     # logger.debug("Released lock for state update")
                 # --- Lock released ---
 
 
                 # --- Recreate disappeared orders (API calls outside lock) ---
                 for order_data in orders_to_recreate:
-                    symbol = get_order_symbol(order_data)
+                    symbol = monitor.order_symbol(order_data)
                     logger.info(f"Attempting to recreate order for {symbol} (ID: {order_data.get('orderId')})")
                     # Ensure place_order uses the correct assetType logic from monitor.py 
                     if monitor.place_order(client, account_hash, order_data):
                         orders_recreated_count += 1
                         # Update count in shared state immediately after success
-                        with state_lock:
+                        with state_lock.gen_wlock():
+                             orders_json_cache["payload"] = None
                              current_state["orders_recreated"] = orders_recreated_count
                         logger.info(f"Successfully recreated order for {symbol}. Total recreated: {orders_recreated_count}")
                     else:
                         logger.error(f"Failed to recreate order for {symbol} (ID: {order_data.get('orderId')}). Will retry next cycle if it remains disappeared.")
 
                 # logger.info(f"Monitor cycle complete. Tracked orders: {len(tracked_orders)}. Ignored: {len(local_ignored_orders)}")
-                time.sleep(1) # Check interval
+                # Wait for the next cycle, or less if a toggle/stop request wakes us
+                dashboard_idle = time.monotonic() - last_orders_request["time"] > DASHBOARD_IDLE_SECONDS
+                monitor_wake.wait(MONITOR_IDLE_INTERVAL if dashboard_idle else monitor.CHECK_INTERVAL)
+                monitor_wake.clear()
 
             except schwab.exceptions.AccessTokenError as e:
                  logger.error(f"Schwab Access Token Error in monitor loop: {e}. Attempting to refresh/re-auth might be needed.", exc_info=True)
@@ -552,11 +745,14 @@ def background_monitor():
 
     except Exception as e:
         logger.critical(f"Background monitoring thread failed critically: {e}", exc_info=True)
-        with state_lock:
+        with state_lock.gen_wlock():
+            orders_json_cache["payload"] = None
             current_state["monitoring_active"] = False
 
 # --- Other Helper Functions ---
 # Make sure get_schwab_client uses easy_client which handles token refresh 1
+schwab_client_lock = threading.Lock() # Guards creation of app.config['schwab_client']
+
 def get_schwab_client():
     """Create and return authenticated Schwab client"""
     API_KEY = os.getenv('SCHWAB_APP_KEY')
@@ -570,13 +766,7 @@ def get_schwab_client():
 
     try:
         # easy_client handles token loading, validation, and refreshing
-        client = schwab.auth.easy_client(
-            api_key=API_KEY,
-            app_secret=APP_SECRET,
-            callback_url=CALLBACK_URL,
-            token_path=TOKEN_PATH,
-            interactive=False # Important for background operation
-        )
+        client = monitor.create_client(API_KEY, APP_SECRET, CALLBACK_URL, TOKEN_PATH)
         logger.info("Schwab client initialized via easy_client.")
         # Perform a quick test call to ensure token validity early
         test_resp = client.get_account_numbers()
@@ -591,6 +781,18 @@ def get_schwab_client():
         raise # Re-raise critical error
 
 
+def get_shared_schwab_client():
+    """Return the process-wide Schwab client from app.config, creating it on first use.
+       Reusing one client keeps its HTTP connection pool (and TLS sessions) alive across polls.
+    """
+    with schwab_client_lock:
+        client = app.config.get('schwab_client')
+        if client is None:
+            client = get_schwab_client()
+            app.config['schwab_client'] = client
+        return client
+
+
 def get_account_hash(client):
     """Get the first account hash from the client"""
     try:
@@ -651,6 +853,46 @@ def get_account_data(client, account_hash):
         return None, 0
 
 
+def position_array_stats(market_values, long_qtys, short_qtys, is_spx, is_spx_option, multiplier):
+    """Numeric core of the position analysis, over parallel float/bool arrays.
+       Returns (counts, prices, priced): the position_stats count fields, a per-position
+       price and a mask of the positions that have one.
+    """
+    counts = {
+        "long_count": int(np.count_nonzero(long_qtys > 0)),
+        "short_count": int(np.count_nonzero(short_qtys > 0)),
+        # Sum total contracts for SPX
+        "spx_long_contracts": float(long_qtys[is_spx].sum()),
+        "spx_short_contracts": float(short_qtys[is_spx].sum())
+    }
+
+    # Price from the long side if held long, otherwise from the short side
+    has_value = market_values != 0
+    long_priced = (long_qtys > 0) & has_value
+    short_priced = ~long_priced & (short_qtys > 0) & has_value
+    prices = np.zeros(len(market_values))
+    prices[long_priced] = market_values[long_priced] / long_qtys[long_priced]
+    prices[short_priced] = np.abs(market_values[short_priced] / short_qtys[short_priced])
+    # For SPX options: ALWAYS divide by multiplier (not conditional)
+    prices[is_spx_option] /= multiplier
+
+    return counts, prices, long_priced | short_priced
+
+# SPX option contract multiplier; marketValue is per contract, prices are per share
+SPX_MULTIPLIER = 100
+
+# The same symbols recur on every tick of a session, so classify each one only once
+@lru_cache(maxsize=4096)
+def classify_symbol(symbol):
+    """Return (is_spx, is_spx_option) for a symbol."""
+    upper = symbol.upper() if symbol else ''
+    is_spx = 'SPX' in upper
+    return is_spx, is_spx and ('C' in upper or 'P' in upper)
+
+# Order statuses and stop order types recognised by analyze_combined_data
+WORKING_STATUSES = frozenset({'WORKING', 'PENDING_ACTIVATION', 'ACCEPTED', 'QUEUED'})
+STOP_ORDER_TYPES = frozenset({'STOP', 'STOP_LIMIT'})
+
 def analyze_combined_data(orders_list, positions_data):
     """
     Analyze both orders and positions & enrich orders with current price data.
@@ -669,74 +911,66 @@ def analyze_combined_data(orders_list, positions_data):
     symbols_with_closing = set()
     
     current_prices = {}
-    MULTIPLIER = 100
-
-    # Helper to determine if a symbol is an SPX option
-    def is_spx_option(symbol):
-        return symbol and 'SPX' in symbol.upper() and any(x in symbol.upper() for x in ['C', 'P'])
 
     if positions_data and isinstance(positions_data, list):
-        spx_positions_debug = []
+        # Gather positions into parallel arrays, then price and count them in bulk
+        n = len(positions_data)
+        symbols = []
+        market_values = np.empty(n)
+        long_qtys = np.empty(n)
+        short_qtys = np.empty(n)
+        count = 0
         for position in positions_data:
             if not isinstance(position, dict):
                 continue
+            symbol = None
             try:
                 instrument = position.get('instrument', {})
                 symbol = instrument.get('symbol', '')
                 if not symbol:
                     continue
 
-                market_value = float(position.get('marketValue', 0))
-                long_qty = float(position.get('longQuantity', 0))
-                short_qty = float(position.get('shortQuantity', 0))
-
-                is_spx = symbol and 'SPX' in symbol.upper()
-                if is_spx:
-                    # Add position to debug list
-                    spx_positions_debug.append({
-                        "symbol": symbol,
-                        "long_qty": long_qty,
-                        "short_qty": short_qty,
-                        "market_value": market_value
-                    })
-                    # Sum total contracts for SPX
-                    position_stats["spx_long_contracts"] += long_qty
-                    position_stats["spx_short_contracts"] += short_qty
-
-                if long_qty > 0 and market_value != 0:
-                    # Calculate price
-                    computed_price = market_value / long_qty
-                    
-                    # For SPX options: ALWAYS divide by multiplier (not conditional)
-                    if is_spx_option(symbol):
-                        computed_price /= MULTIPLIER
-                        logger.debug(f"Adjusted {symbol} price: {computed_price}")
-                    current_prices[symbol] = computed_price
-                elif short_qty > 0 and market_value != 0:
-                    computed_price = abs(market_value / short_qty)
-                    
-                    # For SPX options: ALWAYS divide by multiplier (not conditional)
-                    if is_spx_option(symbol):
-                        computed_price /= MULTIPLIER
-                        logger.debug(f"Adjusted {symbol} price: {computed_price}")
-                    current_prices[symbol] = computed_price
-
-                if long_qty > 0:
-                    position_stats["long_count"] += 1
-                if short_qty > 0:
-                    position_stats["short_count"] += 1
+                # JSON numbers are already int/float and the float64 arrays convert on
+                # assignment (numeric strings too), so no float() call per field
+                market_values[count] = position.get('marketValue') or 0
+                long_qtys[count] = position.get('longQuantity') or 0
+                short_qtys[count] = position.get('shortQuantity') or 0
             except Exception as e:
                 logger.warning(f"Error processing position for {symbol}: {e}")
-
-        # Log summary for SPX
-        logger.info("=== SPX Position Debug Summary ===")
-        for pos in spx_positions_debug:
+                continue
+            symbols.append(symbol)
+            count += 1
+
+        market_values = market_values[:count]
+        long_qtys = long_qtys[:count]
+        short_qtys = short_qtys[:count]
+        flags = [classify_symbol(symbol) for symbol in symbols]
+        is_spx = np.fromiter((f[0] for f in flags), dtype=bool, count=count)
+        is_spx_option = np.fromiter((f[1] for f in flags), dtype=bool, count=count)
+
+        counts, prices, priced = position_array_stats(
+            market_values, long_qtys, short_qtys, is_spx, is_spx_option, SPX_MULTIPLIER
+        )
+        position_stats.update(counts)
+
+        for i in np.flatnonzero(priced):
+            symbol = symbols[i]
+            current_prices[symbol] = float(prices[i])
+            if is_spx_option[i]:
+                logger.debug("Adjusted %s price: %s", symbol, current_prices[symbol])
+
+        # Log summary for SPX (only gathered when INFO logging is on)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("=== SPX Position Debug Summary ===")
+            for i in np.flatnonzero(is_spx):
+                logger.info(
+                    "SPX %s: long_qty=%s, short_qty=%s, market_value=%s",
+                    symbols[i], float(long_qtys[i]), float(short_qtys[i]), float(market_values[i])
+                )
             logger.info(
-                f"SPX {pos['symbol']}: long_qty={pos['long_qty']}, short_qty={pos['short_qty']}, market_value={pos['market_value']}"
+                "SPX Long Contracts Counted: %s, SPX Short Contracts Counted: %s",
+                position_stats['spx_long_contracts'], position_stats['spx_short_contracts']
             )
-        logger.info(
-            f"SPX Long Contracts Counted: {position_stats['spx_long_contracts']}, SPX Short Contracts Counted: {position_stats['spx_short_contracts']}"
-        )
 
     # Part 2: Analyze orders and enrich with current price data
     if isinstance(orders_list, list):
@@ -744,21 +978,22 @@ def analyze_combined_data(orders_list, positions_data):
             if not isinstance(order, dict):
                 continue
             try:
-                symbol = get_order_symbol(order)
-                is_spx = symbol and 'SPX' in symbol.upper()
-                order_type = order.get('orderType', '').upper()
+                # Filter on status first so skipped orders cost a single lookup
                 status = order.get('status', '').upper()
-                
-                if status not in ('WORKING', 'PENDING_ACTIVATION', 'ACCEPTED', 'QUEUED'):
+                if status not in WORKING_STATUSES:
                     continue
+
+                symbol = monitor.order_symbol(order)
+                is_spx = classify_symbol(symbol)[0]
+                order_type = order.get('orderType', '').upper()
                 
                 # When attaching current price to orders, add a flag if we've adjusted the price
                 # This helps UI know how to display it correctly
-                if symbol in current_prices and order_type in ('STOP', 'STOP_LIMIT'):
+                if symbol in current_prices and order_type in STOP_ORDER_TYPES:
                     order['currentPrice'] = current_prices[symbol]
                     order['isAdjustedPrice'] = is_spx and current_prices[symbol] < 100
                 
-                if is_spx and order_type in ('STOP', 'STOP_LIMIT'):
+                if is_spx and order_type in STOP_ORDER_TYPES:
                     position_stats["spx_active_stops"] += 1
                     symbols_with_stops.add(symbol)
                 
@@ -781,9 +1016,9 @@ def analyze_combined_data(orders_list, positions_data):
             except Exception as e:
                 logger.warning(f"Error analyzing order {order.get('orderId', 'N/A')}: {e}")
     
-    logger.debug(f"Current prices for {len(current_prices)} symbols: {current_prices}")
-    logger.debug(f"SPX symbols with stops: {symbols_with_stops}")
-    logger.debug(f"SPX symbols with closing orders: {symbols_with_closing}")
+    logger.debug("Current prices for %d symbols: %s", len(current_prices), current_prices)
+    logger.debug("SPX symbols with stops: %s", symbols_with_stops)
+    logger.debug("SPX symbols with closing orders: %s", symbols_with_closing)
     
     return position_stats
 
@@ -794,6 +1029,10 @@ if __name__ == '__main__':
         logger.info("Application starting...")
         load_ignored_items() # Load state before starting monitor
 
+        saver_thread = threading.Thread(target=ignored_items_saver, name="IgnoredItemsSaver", daemon=True)
+        saver_thread.start()
+        atexit.register(close_ignored_items) # Don't lose a change still inside the debounce window
+
         logger.info("Starting background monitor thread...")
         monitor_thread = threading.Thread(target=background_monitor, name="SchwabMonitorThread", daemon=True)
         monitor_thread.start()
@@ -5,9 +5,12 @@ import schwab
 from schwab.client import Client
 import traceback
 import json
+import hashlib
+import orjson
 import datetime
 import time
-from typing import Dict, List, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Optional
 import logging
 
 # Configure logging
@@ -32,15 +35,49 @@ CALLBACK_URL = os.getenv('SCHWAB_CALLBACK_URL')
 TOKEN_PATH = os.getenv('SCHWAB_TOKEN_PATH', 'token.json')
 ORDERS_CACHE_PATH = os.getenv('ORDERS_CACHE_PATH', 'active_orders.json')
 CHECK_INTERVAL = float(os.getenv('CHECK_INTERVAL', '1.0'))  # Seconds between checks
+FULL_REFRESH_INTERVAL = float(os.getenv('FULL_REFRESH_INTERVAL', '60'))  # Seconds between unwindowed fetches
+ORDER_WINDOW_MARGIN = datetime.timedelta(minutes=5)  # Slack on the entered-time window for clock skew
 
 # Define desired 'active' statuses
 ACTIVE_STATUSES = {'WORKING', 'ACCEPTED', 'PENDING_ACTIVATION', 'QUEUED', 'AWAITING_PARENT_ORDER'}
 
+DIGITS = frozenset('0123456789')
+
+# Fields shared by every recreated order; merged into each request in place_order
+ORDER_REQUEST_BASE = {"session": "NORMAL", "orderStrategyType": "SINGLE"}
+
+# Digest of the last bytes written to each cache file, so unchanged state isn't rewritten
+saved_digests: Dict[str, bytes] = {}
+
+# Minimum seconds between full tracebacks for the same exception type
+ERROR_TRACEBACK_INTERVAL = 5.0
+last_traceback_at: Dict[type, float] = {}
+
+def log_exception_throttled(message: str, exc: Exception) -> None:
+    """Log an error from inside an except block, with the traceback at most once per
+    ERROR_TRACEBACK_INTERVAL for each exception type so a persistent failure can't flood the log.
+    """
+    now = time.monotonic()
+    exc_type = type(exc)
+    if now - last_traceback_at.get(exc_type, float('-inf')) >= ERROR_TRACEBACK_INTERVAL:
+        last_traceback_at[exc_type] = now
+        logger.exception(message)
+    else:
+        logger.error(message)
+
 def save_orders(orders: List[Dict[str, Any]], filepath: str = ORDERS_CACHE_PATH) -> None:
-    """Save active orders to a JSON file for persistence."""
+    """Save active orders to a JSON file for persistence (skipped when nothing changed)."""
     try:
-        with open(filepath, 'w') as f:
-            json.dump(orders, f, indent=2)
+        data = orjson.dumps(orders)
+        digest = hashlib.blake2b(data, digest_size=16).digest()
+        if saved_digests.get(filepath) == digest:
+            return
+        # Write to a temp file and swap it in so a crash never leaves a truncated cache
+        tmp_path = filepath + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, filepath)
+        saved_digests[filepath] = digest
         logger.info(f"Saved {len(orders)} active orders to {filepath}")
     except Exception as e:
         logger.error(f"Failed to save orders to {filepath}: {e}")
@@ -50,26 +87,36 @@ def load_orders(filepath: str = ORDERS_CACHE_PATH) -> List[Dict[str, Any]]:
     if not os.path.exists(filepath):
         return []
     try:
-        with open(filepath, 'r') as f:
-            orders = json.load(f)
+        with open(filepath, 'rb') as f:
+            orders = orjson.loads(f.read())
         logger.info(f"Loaded {len(orders)} orders from {filepath}")
         return orders
     except Exception as e:
         logger.error(f"Failed to load orders from {filepath}: {e}")
         return []
 
-def fetch_active_orders(client, account_hash) -> List[Dict[str, Any]]:
-    """Fetch and return active orders from the Schwab API."""
+def fetch_active_orders(client, account_hash, from_entered_datetime: Optional[datetime.datetime] = None) -> List[Dict[str, Any]]:
+    """Fetch and return active orders from the Schwab API.
+
+    from_entered_datetime narrows the request to orders entered since then;
+    by default the API's own window (the last 60 days) is used.
+    """
     active_orders = []
     
-    orders_response = client.get_orders_for_account(account_hash=account_hash)
+    if from_entered_datetime is None:
+        orders_response = client.get_orders_for_account(account_hash=account_hash)
+    else:
+        orders_response = client.get_orders_for_account(
+            account_hash=account_hash,
+            from_entered_datetime=from_entered_datetime
+        )
     
     if not orders_response.is_success:
         logger.error(f"Failed to fetch orders. Status: {orders_response.status_code}")
         logger.error(f"Response: {orders_response.text}")
         return active_orders
     
-    orders_data = orders_response.json()
+    orders_data = orjson.loads(orders_response.content)
     
     if not isinstance(orders_data, list):
         logger.warning("Unexpected structure in orders response (expected a list)")
@@ -84,6 +131,43 @@ def fetch_active_orders(client, account_hash) -> List[Dict[str, Any]]:
     logger.info(f"Found {len(active_orders)} active orders out of {len(orders_data)} total orders")
     return active_orders
 
+def parse_entered_time(order: Dict[str, Any]) -> Optional[datetime.datetime]:
+    """Parse an order's enteredTime (e.g. '2024-03-14T14:30:00+0000'), or None if missing/invalid."""
+    try:
+        return datetime.datetime.strptime(order.get('enteredTime'), '%Y-%m-%dT%H:%M:%S%z')
+    except (TypeError, ValueError):
+        return None
+
+def order_window_start(tracked_orders, now: datetime.datetime) -> Optional[datetime.datetime]:
+    """Earliest entered time a windowed fetch must cover to still see every tracked order.
+
+    Returns None when an order has no usable enteredTime, in which case the
+    window can't be bounded safely and a full fetch should be done instead.
+    """
+    start = now
+    for order in tracked_orders:
+        entered = parse_entered_time(order)
+        if entered is None:
+            return None
+        start = min(start, entered)
+    return start - ORDER_WINDOW_MARGIN
+
+def order_symbol(order: Dict[str, Any]) -> Optional[str]:
+    """Return an order's symbol (its own instrument first, then its first leg), or None.
+
+    Nothing is cached on the order: these dicts are published by the dashboard
+    and persisted by save_orders, so they must stay exactly as the API returned them.
+    """
+    instrument = order.get('instrument')
+    symbol = instrument.get('symbol') if isinstance(instrument, dict) else None
+    if not symbol:
+        legs = order.get('orderLegCollection')
+        if legs and isinstance(legs, list) and isinstance(legs[0], dict):
+            leg_instrument = legs[0].get('instrument')
+            if isinstance(leg_instrument, dict):
+                symbol = leg_instrument.get('symbol')
+    return symbol or None
+
 def extract_order_info(order_details: Dict[str, Any]) -> Dict[str, Any]:
     """Extract and normalize key information from order details."""
     leg = order_details.get('orderLegCollection', [{}])[0]
@@ -108,8 +192,8 @@ def detect_asset_type(symbol: str) -> str:
     if not symbol:
         return 'EQUITY'
         
-    # If symbol contains any digits, it's an option
-    return 'OPTION' if any(char.isdigit() for char in symbol) else 'EQUITY'
+    # If symbol contains any digits, it's an option (isdisjoint scans in C, no generator)
+    return 'EQUITY' if DIGITS.isdisjoint(symbol) else 'OPTION'
 
 def place_order(client, account_hash, order_details) -> bool:
     """Place a new order based on the provided details."""
@@ -129,10 +213,9 @@ def place_order(client, account_hash, order_details) -> bool:
         
         # Create order request based on order type
         order_request = {
+            **ORDER_REQUEST_BASE,
             "orderType": order_info['order_type'],
-            "session": "NORMAL",
             "duration": order_info['duration'],
-            "orderStrategyType": "SINGLE",
             "orderLegCollection": [
                 {
                     "instruction": order_info['instruction'],
@@ -173,12 +256,13 @@ def place_order(client, account_hash, order_details) -> bool:
             return False
             
     except Exception as e:
-        logger.error(f"Error placing order: {e}")
-        traceback.print_exc()  # Include full stack trace for debugging
+        log_exception_throttled(f"Error placing order: {e}", e)
         return False
 
 def monitor_orders_loop(client, account_hash, check_interval: float = CHECK_INTERVAL):
     """Main monitoring loop to track and recreate orders."""
+    # Cache writes run on a single background worker so disk I/O never delays the next poll
+    save_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="OrderCacheSaver")
     try:
         # Initial fetch of active orders
         current_orders = fetch_active_orders(client, account_hash)
@@ -191,32 +275,70 @@ def monitor_orders_loop(client, account_hash, check_interval: float = CHECK_INTE
         
         logger.info(f"Starting order monitoring loop. Check interval: {check_interval}s")
         logger.info(f"Initially tracking {len(order_by_id)} active orders")
+        last_full_fetch = time.monotonic()
+        next_tick = time.monotonic()
         
         while True:
-            time.sleep(check_interval)
+            # Sleep until the next deadline rather than a fixed interval, so the period
+            # doesn't stretch by however long the previous tick's work took
+            next_tick += check_interval
+            sleep_for = next_tick - time.monotonic()
+            if sleep_for > 0:
+                time.sleep(sleep_for)
+            else:
+                logger.warning("Monitor tick overran by %.3fs", -sleep_for)
+                next_tick = time.monotonic()
+            
+            # Fetch current orders. Between periodic full fetches, only ask for orders entered
+            # since the oldest tracked one: that still covers every order we could lose, while
+            # skipping the long tail of filled/cancelled history. The full fetch picks up older
+            # orders that only became active later.
+            window_start = None
+            if time.monotonic() - last_full_fetch < FULL_REFRESH_INTERVAL:
+                window_start = order_window_start(order_by_id.values(), datetime.datetime.now(datetime.timezone.utc))
+            latest_orders = fetch_active_orders(client, account_hash, from_entered_datetime=window_start)
+            if window_start is None:
+                last_full_fetch = time.monotonic()
             
-            # Fetch current orders
-            latest_orders = fetch_active_orders(client, account_hash)
-            latest_order_ids = {order.get('orderId') for order in latest_orders}
+            # Update our tracking with the latest orders in place, noting which are still active
+            latest_order_ids = set()
+            for order in latest_orders:
+                order_id = order.get('orderId')
+                latest_order_ids.add(order_id)
+                order_by_id[order_id] = order
             
             # Check for disappeared orders
-            for order_id, order_data in list(order_by_id.items()):
-                if order_id not in latest_order_ids:
-                    logger.warning(f"Order {order_id} for {order_data.get('orderLegCollection', [{}])[0].get('instrument', {}).get('symbol')} is no longer active")
-                    
-                    # Attempt to recreate the order
-                    if place_order(client, account_hash, order_data):
-                        logger.info(f"Successfully recreated order for {order_data.get('orderLegCollection', [{}])[0].get('instrument', {}).get('symbol')}")
+            for order_id in order_by_id.keys() - latest_order_ids:
+                order_data = order_by_id.pop(order_id)
+                logger.warning(f"Order {order_id} for {order_symbol(order_data)} is no longer active")
+                
+                # Attempt to recreate the order
+                if place_order(client, account_hash, order_data):
+                    logger.info(f"Successfully recreated order for {order_symbol(order_data)}")
             
-            # Update our tracking with the latest orders
-            order_by_id = {order.get('orderId'): order for order in latest_orders}
-            save_orders(latest_orders)
+            save_executor.submit(save_orders, latest_orders)
             
     except KeyboardInterrupt:
         logger.info("Monitoring stopped by user")
     except Exception as e:
-        logger.error(f"Error in monitoring loop: {e}")
-        traceback.print_exc()
+        log_exception_throttled(f"Error in monitoring loop: {e}", e)
+    finally:
+        save_executor.shutdown(wait=True) # Let the last queued write finish
+
+def create_client(api_key: str = API_KEY, app_secret: str = APP_SECRET,
+                  callback_url: str = CALLBACK_URL, token_path: str = TOKEN_PATH):
+    """Create a Schwab client via easy_client, which handles token loading and refresh.
+
+    Create one per process and reuse it: its httpx session pools keep-alive
+    connections, so every poll after the first skips the TCP/TLS handshake.
+    """
+    return schwab.auth.easy_client(
+        api_key=api_key,
+        app_secret=app_secret,
+        callback_url=callback_url,
+        token_path=token_path,
+        interactive=False # Never prompt; background loops can't answer
+    )
 
 # Main execution flow
 def main():
@@ -231,13 +353,7 @@ def main():
             exit(1)
 
         logger.info("Initializing Schwab client...")
-        client = schwab.auth.easy_client(
-            api_key=API_KEY,
-            app_secret=APP_SECRET,
-            callback_url=CALLBACK_URL,
-            token_path=TOKEN_PATH,
-            interactive=False
-        )
+        client = create_client()
         logger.info("Schwab client initialized successfully.")
 
         # Get account hash